@@ -1,12 +1,13 @@
 """Fork of markdown-it.rs python interface ⚡️"""
 
 from .quickmark import *  # noqa: F403
-from .conversion import md_to_html
+from .conversion import md_to_html, md_to_html_batch
 
 __all__ = (
     "MDParser",
     "Node",
     "__version__",
+    "html_escape",
     "Plugin",
     "LinkExtensionPlugin",
     "ImageExtensionPlugin",
@@ -14,4 +15,5 @@ __all__ = (
     "DisplayMathExtensionPlugin",
     "CitationExtensionPlugin",
     "md_to_html",
+    "md_to_html_batch",
 )  # noqa: F405
@@ -1,3 +1,9 @@
+from collections.abc import Iterable, Sequence
+import functools
+import re
+import types
+from typing import TYPE_CHECKING, Any
+
 from quickmark import (
     MDParser,
     CitationQM,
@@ -7,45 +13,71 @@ from quickmark import (
     InlineMathExtensionPlugin,
     DisplayMathExtensionPlugin,
     CitationExtensionPlugin,
+    InkjetPlugin,
 )
 
+if TYPE_CHECKING:
+    from quickmark.quickmark import _PLUGIN_NAME
 
-def md_to_html(
-    text: str,
-    # citations: list[CitationQM] | None = None,
-    open_links_in_new_tab: bool = True,
-    embed_third_party_content: bool = False,
-    rust_extensions: list[Plugin] | None = None,
-) -> str:
-    if rust_extensions is None:
-        rust_extensions = []
-    rust_extensions = list(rust_extensions)
+# one line of words and punctuation that no default plugin acts on (no markup,
+# html, entities, math, digits or @ for contact info), so the parser would only
+# wrap it in <p>
+PLAIN_PROSE_PATTERN = re.compile(r"[A-Za-z,.;:?!']+(?: [A-Za-z,.;:?!']+)*")
+
+
+def _default_extensions(
+    open_links_in_new_tab: bool, embed_third_party_content: bool
+) -> list[Plugin]:
+    return [
+        Plugin(name="nl2br"),
+        Plugin(name="backticks"),  # inline codeblocks
+        Plugin(name="escape"),  # allow char escapes
+        Plugin(name="emphasis"),
+        LinkExtensionPlugin(
+            embed_third_party_content=embed_third_party_content,
+            open_links_in_new_tab=open_links_in_new_tab,
+        ),
+        ImageExtensionPlugin(),
+        Plugin(name="kagi_contact_info"),
+        Plugin(name="entity"),  # html entities
+        Plugin(name="blockquote"),
+        Plugin(name="hr"),  # markdown line ('---')
+        Plugin(name="list"),
+        Plugin(name="heading"),
+        Plugin(name="paragraph"),
+        Plugin(name="html_inline"),
+        Plugin(name="html_block"),
+        Plugin(name="table"),
+        InlineMathExtensionPlugin(cache=True),
+        DisplayMathExtensionPlugin(cache=True),
+    ]
+
+
+@functools.lru_cache(maxsize=None)
+def _default_parser(
+    open_links_in_new_tab: bool, embed_third_party_content: bool
+) -> MDParser:
+    # NOTE: shared between calls, so it must not be enabled/configured further once built
+    extensions = _default_extensions(
+        open_links_in_new_tab, embed_third_party_content
+    )
+    quickmark_parser = MDParser("zero")
+    quickmark_parser.enable_many(extensions)
+    return quickmark_parser
+
+
+# build the parser for md_to_html's default arguments at import, so the first
+# call doesn't pay for enabling the plugins
+_default_parser(True, False)
+
+
+def _build_parser(
+    open_links_in_new_tab: bool,
+    embed_third_party_content: bool,
+    rust_extensions: "Sequence[Plugin | _PLUGIN_NAME] | None",
+) -> MDParser:
     if not rust_extensions:
-        rust_extensions.extend(
-            [
-                Plugin(name="nl2br"),
-                Plugin(name="backticks"),  # inline codeblocks
-                Plugin(name="escape"),  # allow char escapes
-                Plugin(name="emphasis"),
-                LinkExtensionPlugin(
-                    embed_third_party_content=embed_third_party_content,
-                    open_links_in_new_tab=open_links_in_new_tab,
-                ),
-                ImageExtensionPlugin(),
-                Plugin(name="kagi_contact_info"),
-                Plugin(name="entity"),  # html entities
-                Plugin(name="blockquote"),
-                Plugin(name="hr"),  # markdown line ('---')
-                Plugin(name="list"),
-                Plugin(name="heading"),
-                Plugin(name="paragraph"),
-                Plugin(name="html_inline"),
-                Plugin(name="html_block"),
-                Plugin(name="table"),
-                InlineMathExtensionPlugin(cache=True),
-                DisplayMathExtensionPlugin(cache=True),
-            ]
-        )
+        return _default_parser(open_links_in_new_tab, embed_third_party_content)
     # if citations:
     #     rust_extensions.append(
     #         CitationExtensionPlugin(
@@ -56,9 +88,180 @@ def md_to_html(
     #         )
     #     )
     quickmark_parser = MDParser("zero")
-    quickmark_parser.enable_many(rust_extensions)  # type: ignore[reportArgumentType]
+    quickmark_parser.enable_many(rust_extensions)
+    return quickmark_parser
+
+
+# plugin classes whose whole configuration is exposed through pyo3 getters.
+# CitationExtensionPlugin carries per-answer citations, so it isn't here; neither
+# are python subclasses, their extra state wouldn't be part of the key
+_CACHEABLE_PLUGIN_TYPES = frozenset(
+    {
+        Plugin,
+        LinkExtensionPlugin,
+        ImageExtensionPlugin,
+        InlineMathExtensionPlugin,
+        DisplayMathExtensionPlugin,
+        InkjetPlugin,
+    }
+)
+
+
+@functools.cache
+def _plugin_options(plugin_type: type) -> tuple[str, ...]:
+    """Names of every pyo3 getter of a plugin class, including inherited ones"""
+    return tuple(
+        sorted(
+            name
+            for cls in plugin_type.__mro__
+            for name, attr in vars(cls).items()
+            if isinstance(attr, types.GetSetDescriptorType)
+            and not name.startswith("__")  # e.g. object.__class__
+        )
+    )
+
+
+class _PluginSet:
+    """Hashable plugin list, equal to another one that configures the parser the same way"""
+
+    __slots__ = ("plugins", "key")
+
+    def __init__(
+        self,
+        plugins: "tuple[Plugin | _PLUGIN_NAME, ...]",
+        key: tuple[Any, ...],
+    ) -> None:
+        self.plugins = plugins
+        self.key = key
+
+    @classmethod
+    def from_plugins(
+        cls, plugins: "Sequence[Plugin | _PLUGIN_NAME]"
+    ) -> "_PluginSet | None":
+        """None if any plugin's configuration can't be fully keyed (e.g. citations)"""
+        key: list[tuple[Any, ...]] = []
+        for plugin in plugins:
+            if isinstance(plugin, str):
+                key.append((str, plugin))
+                continue
+            plugin_type: type = type(plugin)
+            if plugin_type in _CACHEABLE_PLUGIN_TYPES:
+                options = _plugin_options(plugin_type)
+                values = tuple(getattr(plugin, name) for name in options)
+                key.append((plugin_type, options, values))
+            else:
+                return None
+        return cls(tuple(plugins), tuple(key))
+
+    def __hash__(self) -> int:
+        return hash(self.key)
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, _PluginSet) and self.key == other.key
+
+
+@functools.lru_cache(maxsize=32)
+def _plugin_set_parser(plugin_set: _PluginSet) -> MDParser:
+    return _build_parser(True, False, plugin_set.plugins)
+
+
+def md_to_html(
+    text: str,
+    # citations: list[CitationQM] | None = None,
+    open_links_in_new_tab: bool = True,
+    embed_third_party_content: bool = False,
+    rust_extensions: Iterable[Plugin] | None = None,
+) -> str:
+    """Convert markdown to HTML with the Rust markdown-it parser.
+
+    Without `rust_extensions`, the default Kagi plugin set is used (links, images,
+    contact info, tables, math, ...). Inline/block HTML is passed through, so
+    `<details>`/`<summary>` tags survive conversion as-is.
+    """
+    # a generator would be exhausted by the cache key before reaching the parser
+    rust_extensions = list(rust_extensions or ())
+    if not rust_extensions:
+        if PLAIN_PROSE_PATTERN.fullmatch(text):
+            return f"<p>{text}</p>"
+        return _cached_md_to_html(
+            text, open_links_in_new_tab, embed_third_party_content, None
+        )
+    plugin_set = _PluginSet.from_plugins(rust_extensions)
+    if plugin_set is not None:
+        # link options only apply to the default plugins, don't split the cache on them
+        return _cached_md_to_html(text, True, False, plugin_set)
+    quickmark_parser = _build_parser(
+        open_links_in_new_tab, embed_third_party_content, rust_extensions
+    )
+    return _render(quickmark_parser, text)
+
+
+def _render(quickmark_parser: MDParser, text: str) -> str:
     text = quickmark_parser.render(text)
     # Sometimes whitespace at end of line
     # Not same behavior as stdlib markdown
     text = text.strip()
     return text
+
+
+# NOTE: the same answer is often rendered again (e.g. on page reload)
+@functools.lru_cache(maxsize=1024)
+def _cached_md_to_html(
+    text: str,
+    open_links_in_new_tab: bool,
+    embed_third_party_content: bool,
+    plugin_set: _PluginSet | None,
+) -> str:
+    if plugin_set is None:
+        quickmark_parser = _default_parser(
+            open_links_in_new_tab, embed_third_party_content
+        )
+    else:
+        quickmark_parser = _plugin_set_parser(plugin_set)
+    return _render(quickmark_parser, text)
+
+
+# allow tests and long running processes to drop cached renders
+md_to_html.cache_clear = _cached_md_to_html.cache_clear  # type: ignore[attr-defined]
+
+
+def md_to_html_batch(
+    texts: list[str],
+    open_links_in_new_tab: bool = True,
+    embed_third_party_content: bool = False,
+    rust_extensions: Iterable[Plugin] | None = None,
+) -> list[str]:
+    """Like `md_to_html` for many texts, sharing one parser and one GIL-free Rust call.
+
+    The Rust side renders in parallel across cores. Plain prose (with the
+    default plugins) and repeated texts are only handled once, in Python.
+    """
+    texts = list(texts)
+    rust_extensions = list(rust_extensions or ())
+    htmls: dict[str, str] = {}
+    if not rust_extensions:
+        htmls = {
+            text: f"<p>{text}</p>"
+            for text in texts
+            if PLAIN_PROSE_PATTERN.fullmatch(text)
+        }
+    # dict keeps order and drops duplicates
+    to_render = list(dict.fromkeys(text for text in texts if text not in htmls))
+    if to_render:
+        plugin_set = None
+        if rust_extensions:
+            # same parser md_to_html uses for an equal plugin list
+            plugin_set = _PluginSet.from_plugins(rust_extensions)
+        if plugin_set is not None:
+            quickmark_parser = _plugin_set_parser(plugin_set)
+        else:
+            quickmark_parser = _build_parser(
+                open_links_in_new_tab,
+                embed_third_party_content,
+                rust_extensions,
+            )
+        rendered = quickmark_parser.render_many(to_render)
+        htmls.update(
+            (text, html.strip()) for text, html in zip(to_render, rendered)
+        )
+    return [htmls[text] for text in texts]
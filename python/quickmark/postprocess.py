@@ -16,6 +16,7 @@ from dataclasses import dataclass
 from enum import Enum, Flag, StrEnum, auto
 from functools import lru_cache, wraps
 from inspect import isgeneratorfunction
+from operator import attrgetter
 from string import Template
 from typing import Annotated, Any, Literal, TypedDict
 
@@ -40,6 +41,19 @@ class AnswerBox(BaseModel):
     image: dict | None = None
 
 
+class Wikipedia(BaseModel):
+    title: str
+    url: str
+    summary: str | None = None
+    table: str | None = None
+
+
+class SummaryBox(BaseModel):
+    title: str
+    url: str
+    snippet: str
+
+
 class SearchResult(BaseModel):
     title: str | None
     url: str
@@ -368,11 +382,11 @@ class Reference(BaseModel):
 
     @property
     def html_title(self) -> str:
-        return html.escape(self.title)
+        return quickmark.html_escape(self.title)
 
     @property
     def html_source(self) -> str:
-        return html.escape(self.source)
+        return quickmark.html_escape(self.source)
 
     def to_html(self, open_links_in_new_tab: bool):
         if self.is_url_source:
@@ -423,8 +437,20 @@ SINGLE_BACKTICK_PATTERN = re.compile(
     r"(?P<code>(?:[^\\`]|\\.)+?)"  # code between valid single ticks
     r"`(?!`)"  # closing backtick, not followed by another
 )
+CITATION_PATTERN = re.compile(r"【(\d+)】")
+BOLD_CITATION_PATTERN = re.compile(r"【\*\*(\d+)\*\*】")
+# a character followed by three or more prime symbols (')
+PRIME_NOTATION_PATTERN = re.compile(r"(\w)('{3,})")
+# trailing list marker - with zero or more spaces at the end of the text
+TRAILING_LIST_MARKER_PATTERN = re.compile(r"- *$")
+
+# NOTE: possessive quantifiers (`*+`, `++`, python 3.11+) in the combined citation,
+# image and link patterns below never give back what they matched, which removes
+# catastrophic backtracking on unclosed brackets/parentheses in LLM output.
+# search/finditer still retry from each start position, so this isn't linear overall
+
 # citations in 1 square bracket that have spaces, comma, and dash in between
-COMBINED_CITATIONS_PATTERN = re.compile(r"(【)(\s{0,3}\d+[,\-\d\s]*)(】)")
+COMBINED_CITATIONS_PATTERN = re.compile(r"(【)(\s{0,3}+\d++[,\-\d\s]*+)(】)")
 
 # - Full image tag with following chars, including surrounding newlines (group 0)
 # - Full image tag with following chars (group 1)
@@ -436,7 +462,7 @@ COMBINED_CITATIONS_PATTERN = re.compile(r"(【)(\s{0,3}\d+[,\-\d\s]*)(】)")
 # - Optional closing parenthesis (group 7)
 # - Any trailing content, up to a pipe ('|') character (table row separator) or newline (group 8)
 IMAGE_MD_PATTERN = re.compile(
-    r"\n?(((\!\[([^\]]+)\])(\()([^)]*)(\))?)([^|\n]*))"
+    r"\n?(((\!\[([^\]]++)\])(\()([^)]*+)(\))?)([^|\n]*+))"
 )
 
 LINK_MD_PATTERN = re.compile(
@@ -446,7 +472,7 @@ LINK_MD_PATTERN = re.compile(
     r"(?P<link_text>.+?)"  # match one or more non-line terminating chars (lazy), group 1
     r"\]"  # close square bracket
     r"(?P<open_parenthesis>\()"  # open parenthesis, group 2
-    r"(?P<url>[^)]*)"  # zero or more characters except close parenthesis, group 3
+    r"(?P<url>[^)]*+)"  # zero or more characters except close parenthesis, group 3
     r"(?P<close_parenthesis>\))?"  # zero or one closing parenthesis, group 4
     r"(\n?)"  # zero or one new line
 )
@@ -456,10 +482,10 @@ LINK_MD_PATTERN = re.compile(
 LINK_OR_IMAGE_MD_PATTERN = re.compile(
     r"(?P<exclamation_point>!?)"  # zero or one exclaimation point, group 1
     r"\["  # open square bracket
-    r"(?P<link_text>!?\[[^\]]*\]\([^)]*\)|[^\]]+)"  # group 2: matches either image markdown OR non-] characters
+    r"(?P<link_text>!?\[[^\]]*+\]\([^)]*+\)|[^\]]++)"  # group 2: matches either image markdown OR non-] characters
     r"\]"  # close square bracket
     r"(?P<open_parenthesis>\()"  # open parenthesis, group 3
-    r"(?P<url>[^)]*)"  # zero or more characters except close parenthesis, group 4
+    r"(?P<url>[^)]*+)"  # zero or more characters except close parenthesis, group 4
     r"(?P<close_parenthesis>\))?"  # zero or one closing parenthesis, group 5
 )
 
@@ -503,7 +529,7 @@ DISPLAY_MATH_BRACKET_PATTERN = re.compile(
 # - match \documentclass literally
 # - optionally matches parameters in square brackets
 # - match required argument in curly braces
-DOCUMENT_CLASS_PATTERN = r"\\documentclass(?:\[.*\])?\{.*}"
+DOCUMENT_CLASS_PATTERN = re.compile(r"\\documentclass(?:\[.*\])?\{.*}")
 
 # Currently only support North American phone number format
 # - can only be at the start of the text or after an open parenthesis or space (avoid matching in URL)
@@ -517,8 +543,9 @@ PHONE_NUMBER_PATTERN = re.compile(
 
 # Check if preceded by start of line or whitespace and proceeded by non-word char (e.g punctuation) or end of line
 # Do this instead of word boundary, because word boundary includes backslash, which may match within URL
+# Domain labels can't contain dots, so there is a single way to split the domain
 EMAIL_PATTERN = re.compile(
-    r"(?:\s|^)([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})(?:\W|$)"
+    r"(?:\s|^)([a-zA-Z0-9._%+-]+@(?:[a-zA-Z0-9-]++\.)+[a-zA-Z]{2,})(?:\W|$)"
 )
 
 # LaTeX env macros that should be filtered out in the output
@@ -619,29 +646,34 @@ def regex_precheck(required_strings: str | tuple, mode: PrecheckMode):
     if mode not in PrecheckMode:
         raise ValueError(f"Invalid PrecheckMode: {mode}")
 
+    # pick the check once here, so each call is a plain substring test
+    if len(required_strings) == 1:
+        (required_string,) = required_strings
+
+        def should_run(text: str) -> bool:
+            return required_string in text
+
+    elif mode is PrecheckMode.ANY:
+
+        def should_run(text: str) -> bool:
+            return any(s in text for s in required_strings)
+
+    else:
+
+        def should_run(text: str) -> bool:
+            return all(s in text for s in required_strings)
+
     def dec(fn):
         @wraps(fn)
         def wrapper(text: str, *args, **kwargs):
-            if (
-                mode is PrecheckMode.ANY
-                and not any(s in text for s in required_strings)
-            ) or (
-                mode is PrecheckMode.ALL
-                and not all(s in text for s in required_strings)
-            ):
+            if not should_run(text):
                 return text
             else:
                 return fn(text, *args, **kwargs)
 
         @wraps(fn)
         def generator_wrapper(text: str, *args, **kwargs):
-            if (
-                mode is PrecheckMode.ANY
-                and not any(s in text for s in required_strings)
-            ) or (
-                mode is PrecheckMode.ALL
-                and not all(s in text for s in required_strings)
-            ):
+            if not should_run(text):
                 yield from empty_generator()
             else:
                 yield from fn(text, *args, **kwargs)
@@ -793,8 +825,7 @@ def split_citations(answer: str) -> str:
                 refs.append(int(ref))
         return refs
 
-    processed_answer = re.sub(
-        COMBINED_CITATIONS_PATTERN,
+    processed_answer = COMBINED_CITATIONS_PATTERN.sub(
         lambda m: "".join(f"【{i}】" for i in expand_references(m.group(2))),
         answer,
     )
@@ -814,8 +845,7 @@ def remove_citation_bold(answer: str) -> str:
     >>> remove_citation_bold("Text without citation.")
     'Text without citation.'
     """
-    answer = re.sub(
-        r"【\*\*(\d+)\*\*】",
+    answer = BOLD_CITATION_PATTERN.sub(
         lambda matchobj: f"【{matchobj.group(1)}】",
         answer,
     )
@@ -828,8 +858,8 @@ def standardize_citation_bracket(answer: str) -> str:
     >>> standardize_citation_bracket('Sample citation with valid syntax【1】.')
     'Sample citation with valid syntax【1】.'
     """
-    return re.sub(
-        r"【(\d+)】", lambda matchobj: f"【{matchobj.group(1)}】", answer
+    return CITATION_PATTERN.sub(
+        lambda matchobj: f"【{matchobj.group(1)}】", answer
     )
 
 
@@ -879,7 +909,7 @@ def remove_invalid_citations(answer: str) -> str:
 @regex_precheck(("【", "】"), PrecheckMode.ALL)
 def detect_citation(answer: str) -> Generator[re.Match, None, None]:
     """Yield citation in non-code text"""
-    for match_obj in re.finditer(r"【(\d+)】", answer):
+    for match_obj in CITATION_PATTERN.finditer(answer):
         yield match_obj
 
 
@@ -888,7 +918,17 @@ def extract_citations(
     passages: list[NodeChunk],
     truncate_citations: bool = True,
 ) -> tuple[str, list[CitationQM], bool]:
-    """Remove citation from text and store in a list of citations"""
+    """Remove citation from text and store in a list of citations
+
+    Passages are only read, never mutated, so calling it again with the same arguments gives the same result.
+
+    >>> passages = [NodeChunk(source="https://a.com", title="A", text="a")]
+    >>> text, citations, truncated = extract_citations("Claim【1】【3】.", passages)
+    >>> text, [citation.to_md() for citation in citations], truncated
+    ('Claim【1】.', ['【1】'], False)
+    >>> extract_citations("Claim【1】【3】.", passages)[0] == text
+    True
+    """
     counter = itertools.count(1)
     source_to_reenumerated_index = defaultdict(lambda: next(counter))
 
@@ -986,7 +1026,7 @@ def get_excerpt_and_citation(
     excerpt_bucket: dict[str, list[CitationQM]] = defaultdict(list)
 
     # TODO: Don't needlessly sort?
-    citations = sorted(citations, key=lambda x: x.md_offset)
+    citations = sorted(citations, key=attrgetter("md_offset"))
 
     for citation in citations:
         if last_citation is not None and citation.succeed(last_citation):
@@ -995,7 +1035,7 @@ def get_excerpt_and_citation(
             excerpt = (
                 text[last_citation_end : citation.md_offset]
                 .rstrip("\n")
-                .rsplit("\n")[-1]
+                .rpartition("\n")[2]
                 .removeprefix(". ")
             )
         if len(excerpt):
@@ -1073,54 +1113,61 @@ def calculate_reference_contribution(
     return percentages_int, citation_contribution
 
 
-def reorder_consecutive_citations(
-    text: str, citations: list[CitationQM], group: list[tuple[int, int]]
-) -> tuple[str, list[CitationQM]]:
-    if len(group) < 2:
-        return text, citations
-
-    ordered_citations = sorted(citations, key=lambda citation: citation.index)
-    offset = 0
-    for idx, span in enumerate(group):
-        text_offset = span[0] + offset
-        old_index = str(citations[idx].index)
-        new_index = str(ordered_citations[idx].index)
-        text = text[:text_offset] + text[text_offset:].replace(
-            old_index, new_index, 1
-        )
-        offset += len(new_index) - len(old_index)
-        ordered_citations[idx] = ordered_citations[idx].model_copy(
-            update={"md_offset": text_offset}
-        )
-    return text, ordered_citations
-
-
 def find_and_reorder_consecutive_citations(
     text: str, citations: list[CitationQM]
 ) -> tuple[str, list[CitationQM]]:
+    """Sort each run of adjacent citations by index, e.g. 【3】【1】 -> 【1】【3】
+
+    Citations are expected in the same order as they appear in the text.
+    Text is rebuilt in a single pass, citation md_offset is updated for reordered runs.
+
+    >>> citations = [CitationQM(i, "", "", "", 0) for i in (3, 1, 2)]
+    >>> text, citations = find_and_reorder_consecutive_citations("A【3】【1】. B【2】.", citations)
+    >>> text, [(c.index, c.md_offset) for c in citations]
+    ('A【1】【3】. B【2】.', [(1, 1), (3, 4), (2, 0)])
+    """
     if len(citations) < 2:
         return text, citations
 
     matches = list(detect_citation(text))
-    group_start = 0
-    group = [matches[0].span()]
-    for idx, (prev_match, current_match) in enumerate(
-        itertools.pairwise(matches), start=1
-    ):
-        if current_match.start() != prev_match.end():
-            text, citations[group_start:idx] = reorder_consecutive_citations(
-                text, citations[group_start:idx], group
+    # runs of citations directly following each other, as [start, end) into matches
+    runs = []
+    run_start = 0
+    for idx in range(1, len(matches)):
+        if matches[idx].start() != matches[idx - 1].end():
+            runs.append((run_start, idx))
+            run_start = idx
+    runs.append((run_start, len(matches)))
+
+    reordered = list(citations)
+    pieces = []
+    text_length = 0  # length of the new text built so far
+    last_end = 0
+    for run_start, run_end in runs:
+        if run_end - run_start < 2:
+            continue
+        before = text[last_end : matches[run_start].start()]
+        pieces.append(before)
+        text_length += len(before)
+        ordered = sorted(citations[run_start:run_end], key=attrgetter("index"))
+        for idx, citation in enumerate(ordered, start=run_start):
+            # CitationQM is a frozen Rust class, build a new one at the new offset
+            reordered[idx] = CitationQM(
+                citation.index,
+                citation.title,
+                citation.source,
+                citation.passage,
+                text_length,
             )
-            group.clear()
-            group_start = idx
-
-        group.append(current_match.span())
-    if group:
-        text, citations[group_start:] = reorder_consecutive_citations(
-            text, citations[group_start:], group
-        )
+            marker = citation.to_md()
+            pieces.append(marker)
+            text_length += len(marker)
+        last_end = matches[run_end - 1].end()
 
-    return text, citations
+    if not pieces:
+        return text, citations
+    pieces.append(text[last_end:])
+    return "".join(pieces), reordered
 
 
 def reorder_references_by_contribution(
@@ -1196,7 +1243,7 @@ def convert_citations_to_references(
     citations: list[CitationQM],
     extracted_documents: list[NodeChunk],
 ) -> list[Reference]:
-    sorted_citations = sorted(citations, key=lambda x: x.index)
+    sorted_citations = sorted(citations, key=attrgetter("index"))
     # the source of an extracted document can be either url (web search result) or file name (user uploaded file)
     source_to_document = {
         document.source: document for document in extracted_documents
@@ -1204,7 +1251,7 @@ def convert_citations_to_references(
 
     references = []
     for (index, source), grouped_citations in itertools.groupby(
-        sorted_citations, key=lambda x: (x.index, x.source)
+        sorted_citations, key=attrgetter("index", "source")
     ):
         cited_result = source_to_document.get(source)
         if cited_result is None:
@@ -1267,6 +1314,24 @@ def format_references(
     return f"{reference_div}{references_body}{reference_close_div}"
 
 
+def iter_fence_lines(text: str) -> Generator[tuple[int, int], None, None]:
+    """Yield (start, end) offsets of lines starting with ``` (after optional whitespace)
+
+    >>> text = "a\\n ```py\\nb ```\\n```"
+    >>> [text[start:end] for start, end in iter_fence_lines(text)]
+    [' ```py', '```']
+    """
+    pos = 0
+    while (fence := text.find("```", pos)) != -1:
+        line_start = text.rfind("\n", 0, fence) + 1
+        line_end = text.find("\n", fence)
+        if line_end == -1:
+            line_end = len(text)
+        if text[line_start:fence].isspace() or line_start == fence:
+            yield line_start, line_end
+        pos = line_end
+
+
 def complete_backtick(text: str) -> str:
     """Complete the string with unclosed backtick.
     This is mainly for streaming text for 2 reasons.
@@ -1320,11 +1385,9 @@ def complete_backtick(text: str) -> str:
 
     processed = []
     for part in splitted:
-        lines = part.split("\n")
         backtick_count = sum(
-            line.count("```") == 1
-            for line in lines
-            if line.lstrip().startswith("```")
+            part.count("```", line_start, line_end) == 1
+            for line_start, line_end in iter_fence_lines(part)
         )
 
         if backtick_count % 2 == 1:
@@ -1420,55 +1483,59 @@ def is_list_line(text_line: str) -> bool:
     )
 
 
-def md_list_generator(text: str) -> Generator[str, None, None]:
-    """Yield ordered and unordered list within text"""
-    # Group consecutive lines by whether they're list lines
-    for is_list, group in itertools.groupby(
-        text.splitlines(), key=is_list_line
-    ):
-        if is_list:
-            yield "\n".join(group)
-
-
 @protect_codeblock(include_inline_code=False, code_placeholder=True)
 def fix_list_spacing_indentation(text: str) -> str:
     """
     dedent markdown list and place newline between list and non list sections
-    """
-    for md_list in md_list_generator(text):
-        dedented_list = textwrap.dedent(md_list)
-        *texts_before_list, texts_after_list = text.split(md_list)
-        stripped = [
-            *[section.rstrip() for section in texts_before_list],
-            texts_after_list,
-        ]
-        text = f"\n\n{dedented_list}".join(stripped)
-    return text
 
+    Lines keep their own endings, so a list between CRLF lines is fixed the same
+    way as one between LF lines (the blank line inserted before it is LF).
 
-def split_closing_code_block_and_citation(
-    text: str,
-) -> Generator[str, None, None]:
-    for line in text.split("\n"):
-        if (
-            line.lstrip().startswith("```")
-            and (citation_char_index := line.find("【")) != -1
-        ):
-            yield line[:citation_char_index].strip()
-            yield line[citation_char_index:]
-        else:
-            yield line
+    >>> fix_list_spacing_indentation("Intro:  \\n   - a\\n     - b\\nOutro")
+    'Intro:\\n\\n- a\\n  - b\\nOutro'
+    >>> fix_list_spacing_indentation("Intro:\\r\\n- a\\r\\n- b\\r\\nOutro")
+    'Intro:\\n\\n- a\\r\\n- b\\r\\nOutro'
+    """
+    pieces: list[str] = []
+    for is_list, group in itertools.groupby(
+        text.splitlines(keepends=True), key=is_list_line
+    ):
+        section = "".join(group)
+        if not is_list:
+            pieces.append(section)
+            continue
+        # strip whitespace at the end of everything before the list
+        while pieces and not pieces[-1].strip():
+            pieces.pop()
+        if pieces:
+            pieces[-1] = pieces[-1].rstrip()
+        pieces.append(f"\n\n{textwrap.dedent(section)}")
+    return "".join(pieces)
 
 
 def fix_code_block_with_citation(text: str) -> str:
     """
     If a citation is on the same line as the end of a code block, formatting gets messed up
     This moves the citation to the next line
+
+    >>> fix_code_block_with_citation("```py\\nx = 1\\n``` 【1】【2】\\nmore")
+    '```py\\nx = 1\\n```\\n【1】【2】\\nmore'
     """
     if not ("\n```" in text and "【" in text):
         return text
-    else:
-        return "\n".join(split_closing_code_block_and_citation(text))
+
+    pieces = []
+    last_end = 0
+    for line_start, line_end in iter_fence_lines(text):
+        citation_char_index = text.find("【", line_start, line_end)
+        if citation_char_index == -1:
+            continue
+        pieces.append(text[last_end:line_start])
+        pieces.append(text[line_start:citation_char_index].strip())
+        pieces.append("\n")
+        last_end = citation_char_index
+    pieces.append(text[last_end:])
+    return "".join(pieces)
 
 
 def replace_prime_notation(md_input):
@@ -1480,14 +1547,12 @@ def replace_prime_notation(md_input):
         power = len(primes)  # Count of prime symbols
         return f"{character}^{{({power})}}"
 
-    # Corrected regular expression to match a character followed by three or more prime symbols (')
-    pattern = r"(\w)('{3,})"
-
-    md_input = re.sub(pattern, replace_with_power, md_input)
+    md_input = PRIME_NOTATION_PATTERN.sub(replace_with_power, md_input)
 
     return md_input
 
 
+@regex_precheck(("&", "<", ">", '"', "'"), PrecheckMode.ANY)
 @protect_codeblock(include_inline_code=True)
 def escape_html(text: str) -> str:
     """
@@ -1502,16 +1567,31 @@ def escape_html(text: str) -> str:
     '`<b>This is a code block.</b>`'
     """
     # NOTE(Ugur): Unescape before escape to neutralize any escaped character before preprocessing
-    return html.escape(html.unescape(text))
+    return quickmark.html_escape(html.unescape(text))
+
+
+ESCAPED_BR_TAGS = {
+    quickmark.html_escape(tag): tag for tag in ("<br>", "<br/>", "<br />")
+}
+ESCAPED_BR_PATTERN = re.compile("|".join(map(re.escape, ESCAPED_BR_TAGS)))
+# a whole line that contains a pipe
+TABLE_LINE_PATTERN = re.compile(r"^[^\n|]*\|.*$", re.MULTILINE)
 
 
-ESCAPED_BR_TAGS = {html.escape(tag): tag for tag in ("<br>", "<br/>", "<br />")}
+def unescape_br_tags(line_match: re.Match) -> str:
+    return ESCAPED_BR_PATTERN.sub(
+        lambda br_match: ESCAPED_BR_TAGS[br_match.group()], line_match.group()
+    )
 
 
+@regex_precheck(("|", "&lt;br"), PrecheckMode.ALL)
 @protect_codeblock(include_inline_code=True, code_placeholder=True)
 def unescape_br_in_table(text: str) -> str:
     """
     HTML unescapes <br> tags (and other variations of <br> tags) in tables
+
+    >>> unescape_br_in_table("| a&lt;br&gt;b | c&lt;br /&gt;d |\\n|---|---|\\nnot&lt;br/&gt;table")
+    '| a<br>b | c<br />d |\\n|---|---|\\nnot&lt;br/&gt;table'
     """
     # NOTE(Rehan): GPT-4o may use <br/> for line breaks in a table for some reason
     # we determine what lines are table lines if they contain a pipe (|).
@@ -1520,13 +1600,7 @@ def unescape_br_in_table(text: str) -> str:
     if not contains_table:
         return text
 
-    new_text = []
-    for line in text.split("\n"):
-        if "|" in line:
-            for escaped, unescaped in ESCAPED_BR_TAGS.items():
-                line = line.replace(escaped, unescaped)
-        new_text.append(line)
-    return "\n".join(new_text)
+    return TABLE_LINE_PATTERN.sub(unescape_br_tags, text)
 
 
 @protect_codeblock(include_inline_code=True)
@@ -1534,18 +1608,40 @@ def string_replace_codeblock_protected(text: str, old: str, new: str):
     return text.replace(old, new)
 
 
+@lru_cache(maxsize=64)
 def get_tag_placeholder(tag: str):
     # NOTE(Rehan): stripping out <> here to make it less tag-like - possible it is still treated as a tag
     return f"‡‡{tag.strip('<>')}_PLACEHOLDER‡‡"
 
 
+@lru_cache(maxsize=16)
+def literal_alternation(strings: tuple[str, ...]) -> re.Pattern:
+    """Pattern matching any of the literal strings, longest first so a string never loses to its prefix"""
+    return re.compile(
+        "|".join(
+            re.escape(string)
+            for string in sorted(strings, key=len, reverse=True)
+        )
+    )
+
+
+@lru_cache(maxsize=16)
+def placeholder_restore_pattern(placeholders: tuple[str, ...]) -> re.Pattern:
+    # a placeholder together with any <p> tags the html conversion wrapped around it
+    return re.compile(
+        rf"(?:<p>)?({literal_alternation(placeholders).pattern})(?:</p>)?"
+    )
+
+
 @protect_codeblock(include_inline_code=True)
 def place_placeholders(
     text: str, tags: list[str], placeholders: list[str]
 ) -> str:
-    for tag, placeholder in zip(tags, placeholders):
-        text = text.replace(tag, placeholder)
-    return text
+    if not tags:
+        return text
+    tag_to_placeholder = dict(zip(tags, placeholders))
+    pattern = literal_alternation(tuple(tag_to_placeholder))
+    return pattern.sub(lambda match: tag_to_placeholder[match.group()], text)
 
 
 @dataclass
@@ -1570,10 +1666,15 @@ def protect_tags(text: str, tags: list[str]):
     text = <tag>hello</tag>
     with protect_tags(text, summary_tags) as container:
         # container.text has placeholders instead of <tag></tag>
-        container.text = markdown.markdown(container.text, extensions=[])
+        container.text = quickmark.md_to_html(container.text)
 
     # placeholders are now reverted
     return container.text
+
+    >>> with protect_tags("<details>**hi**</details>", DROPDOWN_TAGS) as container:
+    ...     container.text = f"<p>{container.text}</p>".replace("**hi**", "<b>hi</b>")
+    >>> container.text
+    '<details><b>hi</b></details>'
     """
     container = TextContainer(text)
     placeholders = [get_tag_placeholder(tag) for tag in tags]
@@ -1581,24 +1682,47 @@ def protect_tags(text: str, tags: list[str]):
     try:
         yield container
     finally:
-        for tag, placeholder in zip(tags, placeholders):
-            # NOTE(Rehan): here we can use regex, but since there are just four different strings we want to match lets just avoid it
-            container.text = (
-                container.text.replace(f"<p>{placeholder}</p>", tag)
-                .replace(f"<p>{placeholder}", tag)
-                .replace(f"{placeholder}</p>", tag)
-                .replace(placeholder, tag)
+        if tags:
+            placeholder_to_tag = dict(zip(placeholders, tags))
+            pattern = placeholder_restore_pattern(tuple(placeholder_to_tag))
+            container.text = pattern.sub(
+                lambda match: placeholder_to_tag[match.group(1)], container.text
             )
 
 
+# collapsible dropdown tags, kept as html around converted markdown with protect_tags
+DROPDOWN_TAGS = ("<details>", "</details>", "<summary>", "</summary>")
+DROPDOWN_PLACEHOLDERS = tuple(get_tag_placeholder(tag) for tag in DROPDOWN_TAGS)
+# build the patterns for the common case at import, not on the first response
+literal_alternation(DROPDOWN_TAGS)
+placeholder_restore_pattern(DROPDOWN_PLACEHOLDERS)
+
+
+@lru_cache(maxsize=16)
+def escaped_tags_pattern(
+    tags: tuple[str, ...],
+) -> tuple[re.Pattern, dict[str, str]]:
+    """Compiled alternation of the escaped tags, and a map back to the raw tags"""
+    escaped_to_tag = {quickmark.html_escape(tag): tag for tag in tags}
+    return literal_alternation(tuple(escaped_to_tag)), escaped_to_tag
+
+
 @protect_codeblock(include_inline_code=True)
 def unescape_tags(text: str, tags: list[str]) -> str:
     """
     unescape XML tag in entire response, besides code (using protect_codeblock decorator)
+
+    >>> unescape_tags("&lt;details&gt;x &lt;b&gt;&lt;/details&gt;", ["<details>", "</details>"])
+    '<details>x &lt;b&gt;</details>'
     """
-    for tag in tags:
-        text = text.replace(html.escape(tag), tag)
-    return text
+    if not tags:
+        return text
+    pattern, escaped_to_tag = escaped_tags_pattern(tuple(tags))
+    return pattern.sub(lambda match: escaped_to_tag[match.group()], text)
+
+
+# escape the dropdown tags once at import, not on the first response
+escaped_tags_pattern(DROPDOWN_TAGS)
 
 
 def remove_wrapper_tag(text: str, tag_name: str) -> str:
@@ -1628,10 +1752,12 @@ def remove_wrapper_tag(text: str, tag_name: str) -> str:
 
 
 def markdown_to_html_preprocess(text: str) -> str:
+    # NOTE: steps that would leave the text unchanged are skipped by their
+    # regex_precheck, so plain prose doesn't pay for each protect_codeblock pass
     text = nest_list_with_4_spaces(text)
     # remove trailing - with zero or more spaces
     # see test_unordered_list_become_heading
-    text = re.sub(r"- *$", "", text)
+    text = TRAILING_LIST_MARKER_PATTERN.sub("", text)
     text = text.removesuffix("- ")
     text = fix_list_spacing_indentation(text)
     text = complete_backtick(text)
@@ -1785,6 +1911,7 @@ def detect_proxy_urls(text: str) -> list[str]:
     return urls_to_be_proxied
 
 
+@regex_precheck("```", PrecheckMode.ALL)
 def normalize_codeblocks(text: str) -> str:
     """
     Dedent codeblocks. This also handles cases where opening and closing fences are indented on different levels, as opposed to simply using `textwrap.dedent() on entire block.`
@@ -1817,7 +1944,7 @@ def normalize_codeblocks(text: str) -> str:
 
 def unescape_dollar(text: str) -> str:
     """Unescape dollar for readability in markdown text"""
-    return re.sub(ESCAPED_DOLLAR_PATTERN, "$", text)
+    return ESCAPED_DOLLAR_PATTERN.sub("$", text)
 
 
 @protect_codeblock(include_inline_code=True)
@@ -1829,9 +1956,9 @@ def cleanup_md_dollar(text: str) -> str:
 @protect_codeblock(include_inline_code=True)
 @regex_precheck(("\\", "{", "}"), PrecheckMode.ALL)
 def remove_latext_text_mode_macros(text: str) -> str:
-    text = re.sub(DOCUMENT_CLASS_PATTERN, "", text)
-    text = re.sub(BEGIN_PATTERN, "", text)
-    text = re.sub(END_PATTERN, "", text)
+    text = DOCUMENT_CLASS_PATTERN.sub("", text)
+    text = BEGIN_PATTERN.sub("", text)
+    text = END_PATTERN.sub("", text)
     return text
 
 
@@ -1906,24 +2033,40 @@ def guard_tag(tag_name: str, response: str) -> str:
 
 
 def has_double_escaped_char(text: str) -> bool:
-    # taken from html.escape function
+    # same chars as html.escape
     html_chars = ["&", "<", ">", '"', "'"]
-    return any(html.escape(html.escape(char)) in text for char in html_chars)
+    return any(
+        quickmark.html_escape(quickmark.html_escape(char)) in text
+        for char in html_chars
+    )
+
+
+THINK_DETAILS_OPEN_TAG = "<details><summary>Thinking</summary>"
+DETAILS_CLOSE_TAG = "</details>"
 
 
 def remove_think_details_tags(content: str) -> str:
-    """Remove everything between (and including) thinking details tags from content"""
-    if content.lstrip().startswith("<details>"):
-        return (
-            re.sub(
-                r"^(\s*<details><summary>Thinking</summary>.*?</details>\s*)",
-                "",
-                content,
-                flags=re.DOTALL,
-            )
-            or "."
-        )
-    return content
+    """Remove everything between (and including) thinking details tags from content
+
+    >>> remove_think_details_tags("<details><summary>Thinking</summary>hmm</details>\\n\\nAnswer")
+    'Answer'
+    >>> remove_think_details_tags("<details><summary>Thinking</summary>hmm</details>")
+    '.'
+    >>> remove_think_details_tags("<details><summary>Thinking</summary>Still thinking...")
+    '<details><summary>Thinking</summary>Still thinking...'
+    >>> remove_think_details_tags("<details><summary>Other</summary>text</details>")
+    '<details><summary>Other</summary>text</details>'
+    >>> remove_think_details_tags("Answer <details><summary>Thinking</summary>hmm</details>")
+    'Answer <details><summary>Thinking</summary>hmm</details>'
+    """
+    stripped = content.lstrip()
+    if not stripped.startswith(THINK_DETAILS_OPEN_TAG):
+        return content
+    # NOTE: plain `find` instead of a DOTALL regex, thinking blocks can be long
+    close_index = stripped.find(DETAILS_CLOSE_TAG, len(THINK_DETAILS_OPEN_TAG))
+    if close_index == -1:
+        return content
+    return stripped[close_index + len(DETAILS_CLOSE_TAG) :].lstrip() or "."
 
 
 def detail_tag_guardrail(text: str) -> str:
@@ -7,11 +7,19 @@ from typing import (
     Optional,
     Sequence,
     Tuple,
+    Union,
 )
 
 __version__: str
 
 
+def html_escape(text: str) -> str:
+    """Escape `& < > " '` for HTML in a single pass, same output as `html.escape(text)`.
+
+    Strings that can't be encoded to UTF-8 (lone surrogates) are passed to `html.escape`.
+    """
+
+
 class Node:
     """Single node in the Markdown AST tree."""
 
@@ -140,6 +148,12 @@ class InkjetPlugin(Plugin):
 
 
 class CitationQM:
+    index: int
+    title: str
+    source: str
+    passage: str
+    md_offset: int
+
     def __init__(
         self,
         index: int,
@@ -149,6 +163,9 @@ class CitationQM:
         md_offset: int,
     ) -> None: ...
 
+    def to_md(self) -> str:
+        """Citation marker as it appears in markdown, e.g. `【1】`"""
+
 
 class CitationExtensionPlugin(Plugin):
     def __init__(
@@ -190,20 +207,20 @@ class MDParser:
 
     def enable(
         self,
-        name: _PLUGIN_NAME,
+        name: Union[_PLUGIN_NAME, "Plugin"],
     ) -> "MDParser":
         """Enable a plugin rule.
 
-        :param name: Plugin name.
+        :param name: Plugin name or plugin instance.
         """
 
     def enable_many(
         self,
-        names: List[_PLUGIN_NAME],
+        names: Sequence[Union[_PLUGIN_NAME, "Plugin"]],
     ) -> "MDParser":
         """Enable multiple plugin rules.
 
-        :param names: Plugin names.
+        :param names: Plugin names or plugin instances.
         """
 
     def render(self, src: str, *, xhtml: bool = True) -> str:
@@ -214,6 +231,14 @@ class MDParser:
         :returns: HTML.
         """
 
+    def render_many(self, srcs: List[str], *, xhtml: bool = True) -> List[str]:
+        """Render many Markdown sources to HTML, in parallel and without holding the GIL.
+
+        :param srcs: Markdown sources.
+        :param xhtml: If true, self-closing tags will include a slash, e.g. `<br />`.
+        :returns: HTML, in the same order as `srcs`.
+        """
+
     def tree(self, src: str) -> Node:
         """Create a syntax tree from the Markdown source.
 
@@ -133,6 +133,44 @@ pub fn escape_html(str: &str) -> Cow<'_, str> {
     html_escape::encode_double_quoted_attribute(str)
 }
 
+/// Escape `& < > " '` with HTML entities in a single pass, same output as python's `html.escape`.
+/// ```
+/// # use quickmark::common::utils::escape_html_text;
+/// assert_eq!(escape_html_text("plain"), "plain");
+/// assert_eq!(escape_html_text("<a href=\"x\">'&'</a>"), "&lt;a href=&quot;x&quot;&gt;&#x27;&amp;&#x27;&lt;/a&gt;");
+/// ```
+pub fn escape_html_text(str: &str) -> Cow<'_, str> {
+    fn entity(b: u8) -> Option<&'static str> {
+        match b {
+            b'&' => Some("&amp;"),
+            b'<' => Some("&lt;"),
+            b'>' => Some("&gt;"),
+            b'"' => Some("&quot;"),
+            b'\'' => Some("&#x27;"),
+            _ => None,
+        }
+    }
+
+    let bytes = str.as_bytes();
+    let Some(first) = bytes.iter().position(|&b| entity(b).is_some()) else {
+        return Cow::Borrowed(str);
+    };
+
+    let mut result = String::with_capacity(str.len() + str.len() / 8 + 8);
+    result.push_str(&str[..first]);
+    let mut last = first;
+    for (pos, &b) in bytes.iter().enumerate().skip(first) {
+        if let Some(replacement) = entity(b) {
+            // all special chars are ascii, so `pos` is always a char boundary
+            result.push_str(&str[last..pos]);
+            result.push_str(replacement);
+            last = pos + 1;
+        }
+    }
+    result.push_str(&str[last..]);
+    Cow::Owned(result)
+}
+
 /// Unicode case folding + space normalization, used for for reference labels.
 ///
 /// So that strings equal according to commonmark standard are converted to
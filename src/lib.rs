@@ -44,16 +44,18 @@ use plugin_config::Plugin;
 // Maturin build
 //
 //
-use pyo3::{exceptions::PyRuntimeError, prelude::*};
+use pyo3::{exceptions::PyRuntimeError, prelude::*, types::PyString};
 mod nodes;
 
-use once_cell::sync::Lazy;
-use std::{panic, panic::AssertUnwindSafe, panic::PanicHookInfo, sync::Mutex};
+use rayon::prelude::*;
+use std::{borrow::Cow, cell::RefCell, panic, panic::AssertUnwindSafe, panic::PanicHookInfo};
 
 // NOTE(Rehan): storage for the most recent panic message
-// need to be mutex to be global variable that can be written to on runtime
-// even though multiple threads not expected
-static LAST_PANIC: Lazy<Mutex<Option<String>>> = Lazy::new(|| Mutex::new(None));
+// the panic hook runs on the panicking thread, so a per-thread slot keeps concurrent renders
+// (GIL released, rayon workers) from reading each other's messages
+thread_local! {
+    static LAST_PANIC: RefCell<Option<String>> = const { RefCell::new(None) };
+}
 
 /// throw in our custom panic hook to silence rust panics and store the message instead
 pub fn init_panic_hook() {
@@ -72,10 +74,20 @@ pub fn init_panic_hook() {
             msg.push_str(&format!(" at {}:{}", location.file(), location.line()));
         }
 
-        *(LAST_PANIC.lock().unwrap()) = Some(msg);
+        LAST_PANIC.with_borrow_mut(|last| *last = Some(msg));
     }));
 }
 
+/// Run `f`, turning a panic into its message. Must be read on the thread that panicked,
+/// so the message is carried out of `catch_unwind` instead of being looked up later
+fn catch_panic<T>(f: impl FnOnce() -> T) -> Result<T, String> {
+    panic::catch_unwind(AssertUnwindSafe(f)).map_err(|_| {
+        LAST_PANIC
+            .with_borrow_mut(Option::take)
+            .unwrap_or_else(|| "Rust panic occurred".to_owned())
+    })
+}
+
 #[derive(FromPyObject)]
 enum AnyPlugin<'py> {
     #[pyo3(transparent)]
@@ -260,6 +272,18 @@ impl MDParser {
 
 
 
+    /// Parse and render, catching any panic so its message can be raised in python
+    fn _render(&self, src: &str, xhtml: bool) -> Result<String, String> {
+        catch_panic(|| {
+            let preprocessed = preprocess(src, &self.enabled_plugin_names);
+            let ast = self.parser.parse(preprocessed.as_ref());
+            match xhtml {
+                true => ast.xrender(),
+                false => ast.render(),
+            }
+        })
+    }
+
     fn _enable(&mut self, py: Python, plugin: Py<Plugin>) -> Result<(), PyErr> {
         match plugin.extract::<AnyPlugin>(py)? {
             AnyPlugin::Link(p) => link::add(&mut self.parser, *p),
@@ -407,31 +431,22 @@ impl MDParser {
     /// Render markdown string into HTML.
     /// If `xhtml` is true, then self-closing tags will include a slash, e.g. `<br />`.
     #[pyo3(signature = (src, *, xhtml=true))]
-    pub fn render(&self, src: &str, xhtml: bool) -> PyResult<String> {
-        let result = panic::catch_unwind(AssertUnwindSafe(|| {
-            let preprocessed = preprocess(src, &self.enabled_plugin_names);
-            let ast = self.parser.parse(preprocessed.as_ref());
-            match xhtml {
-                true => ast.xrender(),
-                false => ast.render(),
-            }
-        }));
-
-        match result {
-            Ok(html) => Ok(html),
-            Err(_) => {
-                // unwrap ok here, can only be error if another thread doesn't let go of mutex
-                // but we don't expect that, one panic and we send the error up and stop
-                let lock_result = LAST_PANIC.lock();
-                let msg = match lock_result {
-                    Err(_) => "mutex lock failed".to_owned(),
-                    Ok(mut lock) => lock
-                        .take()
-                        .unwrap_or_else(|| "Rust panic occurred".to_owned()),
-                };
-                Err(PyRuntimeError::new_err(msg))
-            }
-        }
+    pub fn render(&self, py: Python, src: &str, xhtml: bool) -> PyResult<String> {
+        // NOTE: parsing doesn't touch python objects, so let other python threads run meanwhile
+        py.detach(|| self._render(src, xhtml))
+            .map_err(PyRuntimeError::new_err)
+    }
+
+    /// Render many markdown strings into HTML, in parallel across cores.
+    /// Output order matches input order.
+    #[pyo3(signature = (srcs, *, xhtml=true))]
+    pub fn render_many(&self, py: Python, srcs: Vec<String>, xhtml: bool) -> PyResult<Vec<String>> {
+        py.detach(|| {
+            srcs.par_iter()
+                .map(|src| self._render(src, xhtml))
+                .collect::<Result<Vec<_>, _>>()
+        })
+        .map_err(PyRuntimeError::new_err)
     }
 
     /// Create a syntax tree from the markdown string.
@@ -445,27 +460,15 @@ impl MDParser {
                 py_node.children.push(Py::new(py, py_node_child).unwrap());
             }
         }
-        let result = panic::catch_unwind(AssertUnwindSafe(|| {
+        let result = catch_panic(|| {
             let preprocessed = preprocess(src, &self.enabled_plugin_names);
             let ast = self.parser.parse(preprocessed.as_ref());
 
             let mut py_node = nodes::create_node(py, &ast);
             walk_recursive(py, &ast, &mut py_node);
             py_node
-        }));
-        match result {
-            Ok(node) => Ok(node),
-            Err(_) => {
-                let lock_result = LAST_PANIC.lock();
-                let msg = match lock_result {
-                    Err(_) => "mutex lock failed".to_owned(),
-                    Ok(mut lock) => lock
-                        .take()
-                        .unwrap_or_else(|| "Rust panic occurred".to_owned()),
-                };
-                Err(PyRuntimeError::new_err(msg))
-            }
-        }
+        });
+        result.map_err(PyRuntimeError::new_err)
     }
     /// warmup for quickmark
     fn warmup(&self, _py: Python) {
@@ -473,6 +476,31 @@ impl MDParser {
     }
 }
 
+/// Escape `& < > " '` for HTML, equivalent to python's `html.escape(text)`
+#[pyfunction]
+fn html_escape<'py>(py: Python<'py>, text: Bound<'py, PyString>) -> PyResult<Bound<'py, PyString>> {
+    // `to_cow` borrows the utf-8 data where the ABI allows it (`to_str` isn't in abi3 before 3.10)
+    let escaped = match text.to_cow() {
+        Ok(src) => match common::utils::escape_html_text(&src) {
+            Cow::Borrowed(_) => None,
+            Cow::Owned(escaped) => Some(escaped),
+        },
+        // lone surrogates can't be encoded to utf-8, python's html.escape still handles them
+        Err(_) => {
+            return py
+                .import("html")?
+                .getattr("escape")?
+                .call1((text,))?
+                .extract();
+        }
+    };
+    Ok(match escaped {
+        // nothing to escape, hand back the same python object
+        None => text,
+        Some(escaped) => PyString::new(py, &escaped),
+    })
+}
+
 #[pymodule]
 // Note: The name of this function must match the `lib.name` setting in the `Cargo.toml`,
 // else Python will not be able to import the module.
@@ -489,6 +517,7 @@ fn quickmark(m: &Bound<'_, PyModule>) -> PyResult<()> {
     m.add_class::<InlineMathExtensionPlugin>()?;
     m.add_class::<DisplayMathExtensionPlugin>()?;
     m.add_class::<InkjetPlugin>()?;
+    m.add_function(wrap_pyfunction!(html_escape, m)?)?;
     // let plugins_module = PyModule::new(py, "plugins")?;
     // plugins_module.add_function(wrap_pyfunction!(plugins::add_heading_anchors, plugins_module)?)?;
     // m.add_submodule(plugins_module)?;
@@ -15,7 +15,7 @@ use std::borrow::Cow;
 // - Capture group 2 is the email
 // - Capture group 3 is the whitespace afterwards
 pub static EMAIL_REGEX: Lazy<Regex> = Lazy::new(|| {
-    Regex::new(r"(\s|^)([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})(\W|$)").unwrap()
+    Regex::new(r"(\s|^)([a-zA-Z0-9._%+-]+@(?:[a-zA-Z0-9-]+\.)+[a-zA-Z]{2,})(\W|$)").unwrap()
 });
 
 // NOTE(Rehan): (from postprocess.py)
@@ -87,20 +87,45 @@ fn apply_regex<'a>(src: Cow<'a, str>, regex: &Regex, replacement: &str) -> Cow<'
     match src {
         Cow::Borrowed(s) => regex.replace_all(s, replacement),
         Cow::Owned(s) => {
-            let result = regex.replace_all(&s, replacement);
-            Cow::Owned(result.into_owned())
+            // NOTE: a borrowed result means nothing matched, so keep the string we already own
+            // instead of copying it
+            let replaced = match regex.replace_all(&s, replacement) {
+                Cow::Borrowed(_) => None,
+                Cow::Owned(result) => Some(result),
+            };
+            Cow::Owned(replaced.unwrap_or(s))
         }
     }
 }
 
+/// Minimum number of digits in a PHONE_NUMBER_REGEX match (3 + 3 + 4)
+const PHONE_NUMBER_MIN_DIGITS: usize = 10;
+
+/// Cheap check before running PHONE_NUMBER_REGEX: a match needs at least 10 digits.
+/// `\d` is unicode aware, so count all numeric chars, not just ascii ones
+fn may_contain_phone_number(src: &str) -> bool {
+    src.chars()
+        .filter(|c| c.is_numeric())
+        .take(PHONE_NUMBER_MIN_DIGITS)
+        .count()
+        == PHONE_NUMBER_MIN_DIGITS
+}
+
 fn apply_contact_info_regex(src: Cow<'_, str>) -> Cow<'_, str> {
     // NOTE(Rehan): this makes phone numbers like <tel:999-999-99999> and emails like <mailto:joedoe@example.com>
-    let mut processed = apply_regex(src, &EMAIL_REGEX, &format!("$1<{}$2>$3", MAIL_PREFIX));
-    processed = apply_regex(
-        processed,
-        &PHONE_NUMBER_REGEX,
-        &format!("$1<{}$2>", PHONE_PREFIX),
-    );
+    // every email match has an `@`, a memchr scan is far cheaper than running the regex
+    let mut processed = if src.contains('@') {
+        apply_regex(src, &EMAIL_REGEX, &format!("$1<{}$2>$3", MAIL_PREFIX))
+    } else {
+        src
+    };
+    if may_contain_phone_number(&processed) {
+        processed = apply_regex(
+            processed,
+            &PHONE_NUMBER_REGEX,
+            &format!("$1<{}$2>", PHONE_PREFIX),
+        );
+    }
     processed
 }
 
@@ -166,28 +191,29 @@ fn reenumerate_citations(src: Cow<'_, str>) -> Cow<'_, str> {
     Cow::Owned(result.into_owned())
 }
 
+// NOTE(Rehan): here we can define a preprocessor for each plugin
+// so we only run certain preprocessing if the plugin is enabled
+const PREPROCESSORS: [Preprocessor; 2] = [
+    Preprocessor {
+        name: "kagi_contact_info",
+        processor: apply_contact_info_regex,
+        include_inline_code: true,
+    },
+    Preprocessor {
+        name: "citation",
+        processor: reenumerate_citations,
+        include_inline_code: true,
+    },
+];
+
 pub fn preprocess<'a>(src: &'a str, enabled_plugins: &[String]) -> Cow<'a, str> {
     let mut processed = Cow::Borrowed(src);
 
-    // NOTE(Rehan): here we can define a preprocessor for each plugin
-    // so we only run certain preprocessing if the plugin is enabled
-    let processors = vec![
-        Preprocessor {
-            name: "kagi_contact_info",
-            processor: apply_contact_info_regex,
-            include_inline_code: true,
-        },
-        Preprocessor {
-            name: "citation",
-            processor: reenumerate_citations,
-            include_inline_code: true,
-        },
-    ];
-
     // NOTE(Rehan): conflicting pattern matches go in order of enabled plugins
     // ideally no conflict though
-    for preprocessor in processors {
-        if enabled_plugins.contains(&preprocessor.name.to_string()) {
+    for preprocessor in &PREPROCESSORS {
+        // compare as &str, no String is built per plugin on every render
+        if enabled_plugins.iter().any(|name| name == preprocessor.name) {
             processed = protect_codeblocks(
                 processed,
                 preprocessor.include_inline_code,
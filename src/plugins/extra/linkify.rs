@@ -54,7 +54,13 @@ impl CoreRule for LinkifyPrescan {
     fn run(root: &mut Node, _: &MarkdownIt) {
         let root_data = root.cast_mut::<Root>().unwrap();
         let source = root_data.content.as_str();
-        let finder = LinkFinder::new();
+        // every url needs a scheme, so no `:` means nothing to find (memchr scan)
+        if !source.contains(':') {
+            root_data.ext.insert(LinkifyState::new());
+            return;
+        }
+        let mut finder = LinkFinder::new();
+        finder.kinds(&[LinkKind::Url]);
         let positions = finder.links(source).filter_map(|link| {
             if *link.kind() == LinkKind::Url {
                 Some(LinkifyPosition {
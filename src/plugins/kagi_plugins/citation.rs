@@ -1,25 +1,39 @@
+use crate::mdparser::extset::MarkdownItExt;
 use crate::mdparser::inline::{InlineRule, InlineState};
 use crate::plugin_config::CitationExtensionPlugin;
 use crate::{MarkdownIt, Node, NodeValue, Renderer};
 use pyo3::prelude::*;
+use pyo3::types::PyString;
+use std::fmt::Write;
+use std::sync::Arc;
 
 const OPEN_CITATION: char = '【';
 const CLOSE_CITATION: char = '】';
 
-#[pyclass]
+#[pyclass(frozen)]
 #[derive(Debug, Clone)]
 pub struct CitationQM {
+    #[pyo3(get)]
     pub index: usize,
+    #[pyo3(get)]
     pub title: String,
+    #[pyo3(get)]
     pub source: String,
+    #[pyo3(get)]
     pub passage: String,
+    #[pyo3(get)]
     pub md_offset: usize,
+    // NOTE: index can't change after construction, so the markdown marker is built once here,
+    // already as a python str so `to_md` only hands out a new reference.
+    // `Arc` keeps the struct `Clone` without needing the GIL
+    md: Arc<Py<PyString>>,
 }
 
 #[pymethods]
 impl CitationQM {
     #[new]
     fn new(
+        py: Python<'_>,
         index: usize,
         title: String,
         source: String,
@@ -32,8 +46,17 @@ impl CitationQM {
             source,
             passage,
             md_offset,
+            md: Arc::new(
+                PyString::new(py, &format!("{}{}{}", OPEN_CITATION, index, CLOSE_CITATION))
+                    .unbind(),
+            ),
         })
     }
+
+    /// Citation marker as it appears in markdown, e.g. `【1】`
+    fn to_md(&self, py: Python<'_>) -> Py<PyString> {
+        self.md.clone_ref(py)
+    }
 }
 
 // NOTE(Rehan): port of `.to_html` method of python citation class
@@ -43,41 +66,41 @@ pub fn citation_to_html(
     index: usize,
     open_in_new_tab: bool,
 ) -> String {
+    // fixed template, only the href and index vary: size the buffer once and push the pieces
+    let mut html = String::with_capacity(source.len() + 48);
     if is_url_source {
-        let target_attr = if open_in_new_tab {
-            r#" target="_blank""#
+        html.push_str(r#"<a href=""#);
+        html.push_str(source);
+        html.push_str(if open_in_new_tab {
+            r#"" target="_blank">"#
         } else {
-            ""
-        };
-
-        format!(
-            r#"<a href="{url}"{target}>{index}</a>"#,
-            url = source,
-            target = target_attr,
-            index = index
-        )
+            r#"">"#
+        });
     } else {
-        format!(r#"<a>{}</a>"#, index)
+        html.push_str("<a>");
     }
+    write!(html, "{index}").unwrap();
+    html.push_str("</a>");
+    html
 }
 
+/// `<a>` html of every citation, indexed like `CitationExtensionPlugin.citations`.
+/// Rendered once when the plugin is added, nodes only share it
+#[derive(Debug, Default)]
+struct CitationHtml(Vec<Arc<str>>);
+
+impl MarkdownItExt for CitationHtml {}
+
 #[derive(Debug)]
 pub struct CitationNode {
-    pub citation: CitationQM,
-    pub open_link_in_new_tab: bool,
+    pub html: Arc<str>,
 }
 
 impl NodeValue for CitationNode {
     fn render(&self, node: &Node, fmt: &mut dyn Renderer) {
         let attrs = node.attrs.clone();
-        let citation_html = citation_to_html(
-            self.citation.source.starts_with("http"),
-            &self.citation.source,
-            self.citation.index,
-            self.open_link_in_new_tab,
-        );
         fmt.open("sup", &attrs);
-        fmt.text_raw(&citation_html);
+        fmt.text_raw(&self.html);
         fmt.close("sup");
     }
 }
@@ -89,35 +112,33 @@ impl InlineRule for CitationInlineScanner {
 
     fn run(state: &mut InlineState) -> Option<(Node, usize)> {
         let input = &state.src[state.pos..state.pos_max];
-        if !input.starts_with(OPEN_CITATION) || !input.contains(CLOSE_CITATION) {
-            return None;
-        }
-        let config = state.md.ext.get::<CitationExtensionPlugin>().unwrap();
-
-        let citation_match = input.split_inclusive(CLOSE_CITATION).next()?;
-
-        let citation_index: usize = citation_match
-            .strip_prefix(OPEN_CITATION)?
-            .strip_suffix(CLOSE_CITATION)?
-            .parse()
-            .ok()?;
-
-        let citation = config
-            .citations
-            .get(citation_index)?    
-            .clone();
-
-        Some((
-            Node::new(CitationNode {
-                citation,
-                open_link_in_new_tab: config.open_links_in_new_tab,
-            }),
-            citation_match.len(),
-        ))
+        let rest = input.strip_prefix(OPEN_CITATION)?;
+        let close = rest.find(CLOSE_CITATION)?;
+        let citation_html = state.md.ext.get::<CitationHtml>().unwrap();
+
+        let citation_index: usize = rest[..close].parse().ok()?;
+        let citation_len = OPEN_CITATION.len_utf8() + close + CLOSE_CITATION.len_utf8();
+
+        let html = citation_html.0.get(citation_index)?.clone();
+
+        Some((Node::new(CitationNode { html }), citation_len))
     }
 }
 
 pub fn add(md: &mut MarkdownIt, config: CitationExtensionPlugin) {
-    md.ext.insert(config);
+    let html = config
+        .citations
+        .iter()
+        .map(|citation| {
+            citation_to_html(
+                citation.source.starts_with("http"),
+                &citation.source,
+                citation.index,
+                config.open_links_in_new_tab,
+            )
+            .into()
+        })
+        .collect();
+    md.ext.insert(CitationHtml(html));
     md.inline.add_rule::<CitationInlineScanner>();
 }
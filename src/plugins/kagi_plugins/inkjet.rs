@@ -12,6 +12,8 @@ use crate::plugin_config::InkjetPlugin;
 use crate::{MarkdownIt, Node, NodeValue, Renderer};
 use std::cell::RefCell;
 
+const CODE_HIGHLIGHT_FILENAME_PREFIX: &str = "<div class=\"codehilite\"><span class=\"filename\">";
+const CODE_HIGHLIGHT_CODE_PREFIX: &str = "</span><pre><span></span><code>";
 pub const CODE_HIGHLIGHT_SUFFIX: &str = "</code></pre></div>";
 // NOTE(Rehan): if we want to reuse the highlighter, it needs to be mutable
 // `thread_local!` runs once per thread. `RefCell` moves compile time borrow to runtime.
@@ -91,16 +93,13 @@ impl NodeValue for InkjetCodeFence {
         // NOTE(Rehan): this is what our python code highlighting extension has wrapped around the actual highlighted code
         // so we'll wrap here as well for compatibility
         // `class="codehilite"` from SuperFences extension, `class="filename"` from Highlight extension
-
-        let html = format!(
-            "<div class=\"codehilite\">\
-                    <span class=\"filename\">{:?}</span>\
-                    <pre><span></span><code>{html}{CODE_HIGHLIGHT_SUFFIX}",
-            lang_enum,
-        );
-
+        // only the language name varies, the rest is written from constants without copying `html` again
         fmt.cr();
+        fmt.text_raw(CODE_HIGHLIGHT_FILENAME_PREFIX);
+        fmt.text_raw(&format!("{:?}", lang_enum));
+        fmt.text_raw(CODE_HIGHLIGHT_CODE_PREFIX);
         fmt.text_raw(&html);
+        fmt.text_raw(CODE_HIGHLIGHT_SUFFIX);
         fmt.cr();
     }
 }
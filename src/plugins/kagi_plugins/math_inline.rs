@@ -33,6 +33,11 @@ impl InlineRule for MathInlineScanner {
         if !input.starts_with(Self::MARKER) {
             return None;
         }
+        // a lone `$` (e.g. prices) can't match, find the closing marker with memchr
+        // instead of running the backtracking regex
+        if !input[Self::MARKER.len_utf8()..].contains(Self::MARKER) {
+            return None;
+        }
         let config = state.md.ext.get::<InlineMathExtensionPlugin>().unwrap();
 
         let valid_preceeding_chars = ['*', '(', '：'];
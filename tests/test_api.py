@@ -1,4 +1,6 @@
-from quickmark import MDParser, Node
+import html
+
+from quickmark import MDParser, Node, html_escape
 import pytest
 
 
@@ -50,6 +52,21 @@ def test_render_xhtml() -> None:
     assert "/></p>\n" not in res2
 
 
+@pytest.mark.parametrize(
+    "text",
+    [
+        "",
+        "plain",
+        "<b>&amp;</b>",
+        '"\'"',
+        "ünïcode <日本> & more",
+        "lone \ud800 surrogate & more",
+    ],
+)
+def test_html_escape(text: str) -> None:
+    assert html_escape(text) == html.escape(text)
+
+
 def test_node() -> None:
     node = Node("root")
     assert node.name == "root"
@@ -1,6 +1,15 @@
+import re
 import textwrap
 
-from quickmark.conversion import md_to_html
+import pytest
+
+from quickmark.conversion import (
+    _default_parser,
+    _PluginSet,
+    _plugin_set_parser,
+    md_to_html,
+    md_to_html_batch,
+)
 from quickmark import (
     CitationExtensionPlugin,
     CitationQM,
@@ -9,7 +18,10 @@ from quickmark import (
     LinkExtensionPlugin,
     Plugin,
 )
-import quickmark
+
+# plugins without per-test state, built once and shared by the tests
+NL2BR = Plugin("nl2br")
+PARAGRAPH = Plugin("paragraph")
 
 
 class TestLinkProcessor:
@@ -96,47 +108,55 @@ class TestContactInfo:
     # NOTE(Rehan): Above are new tests, below ported over from `test_postprocess.py`
     # tests not exactly the same, minor formatting changes (quickmark will always surround number with quotation marks)
 
-    def test_plain_phone_number(self):
-        text = "Contact me at 123-456-7890."
+    @pytest.mark.parametrize(
+        ("text", "expected_links"),
+        [
+            pytest.param(
+                "Contact me at 123-456-7890.",
+                ['<a href="tel:1234567890">123-456-7890</a>'],
+                id="plain_phone_number",
+            ),
+            pytest.param(
+                "For general ticket sales and inquiries: (800)-515-2171.",
+                [': <a href="tel:8005152171">(800)-515-2171</a>'],
+                id="phone_number_with_parentheses",
+            ),
+            pytest.param(
+                "Hotline For Canada: ((877)-529-7746).",
+                [': (<a href="tel:8775297746">(877)-529-7746</a>)'],
+                id="phone_number_with_double_parentheses",
+            ),
+            pytest.param(
+                "Phone number can also be formatted with dots: 123.456.7890.",
+                [': <a href="tel:1234567890">123.456.7890</a>'],
+                id="phone_number_with_dots",
+            ),
+            pytest.param(
+                "Contact me at +12 123-456-7890 or email me at john.doe@amazon.co.jp",
+                [
+                    'Contact me at <a href="tel:+121234567890">+12 123-456-7890</a>'
+                ],
+                id="phone_number_with_spaces",
+            ),
+            pytest.param(
+                "You can reach the support team at 1-800-123-4567 or email them at support@kaggle.com.",
+                [
+                    '<a href="tel:18001234567">1-800-123-4567</a>',
+                    '<a href="mailto:support@kaggle.com">support@kaggle.com</a>',
+                ],
+                id="phone_number_with_email",
+            ),
+            pytest.param(
+                "(123-456-7890",
+                ['<a href="tel:1234567890">123-456-7890</a>'],
+                id="phone_number_preceded_by_open_parenthesis",
+            ),
+        ],
+    )
+    def test_contact_links(self, text, expected_links):
         output = md_to_html(text)
-        assert '<a href="tel:1234567890">123-456-7890</a>' in output
-
-    def test_phone_number_with_parentheses(self):
-        text = "For general ticket sales and inquiries: (800)-515-2171."
-        output = md_to_html(text)
-        assert ': <a href="tel:8005152171">(800)-515-2171</a>' in output
-
-    def test_phone_number_with_double_parentheses(self):
-        text = "Hotline For Canada: ((877)-529-7746)."
-        output = md_to_html(text)
-        assert ': (<a href="tel:8775297746">(877)-529-7746</a>)' in output
-
-    def test_phone_number_with_dots(self):
-        text = "Phone number can also be formatted with dots: 123.456.7890."
-        output = md_to_html(text)
-        assert ': <a href="tel:1234567890">123.456.7890</a>' in output
-
-    def test_phone_number_with_spaces(self):
-        text = "Contact me at +12 123-456-7890 or email me at john.doe@amazon.co.jp"
-        output = md_to_html(text)
-        assert (
-            'Contact me at <a href="tel:+121234567890">+12 123-456-7890</a>'
-            in output
-        )
-
-    def test_phone_number_with_email(self):
-        text = "You can reach the support team at 1-800-123-4567 or email them at support@kaggle.com."
-        output = md_to_html(text)
-        assert '<a href="tel:18001234567">1-800-123-4567</a>' in output
-        assert (
-            '<a href="mailto:support@kaggle.com">support@kaggle.com</a>'
-            in output
-        )
-
-    def test_phone_number_preceded_by_open_parenthesis(self):
-        text = "(123-456-7890"
-        output = md_to_html(text)
-        assert '<a href="tel:1234567890">123-456-7890</a>' in output
+        missing = [link for link in expected_links if link not in output]
+        assert not missing
 
     def test_ignore_phone_number_preceded_by_non_whitespace_char(self):
         text = "This is a phone number:123-456-7890."
@@ -167,14 +187,137 @@ class TestContactInfo:
         output = md_to_html(text)
         assert '<a href="mailto' not in output
 
+    def test_email_with_empty_domain_label(self):
+        text = "Not an email: guy@example..com or guy@.example.com"
+        output = md_to_html(text)
+        assert '<a href="mailto' not in output
+
 
 def test_nl2b():
     md_text = "hi\nhi\nhi"
-    extensions = [Plugin("nl2br"), Plugin("paragraph")]
+    extensions = [NL2BR, PARAGRAPH]
     html_text = md_to_html(md_text, rust_extensions=extensions)
     assert html_text.count("<br />") == 2
 
 
+@pytest.mark.parametrize(
+    "md_text",
+    [
+        "Hello world.",
+        "It's fine, really!",
+        "Is it? Yes: no; maybe.",
+        "Call 555-123-4567 now.",
+        "Email a@b.com",
+        "a  b",
+        " padded ",
+        "two\nlines",
+        "**bold**",
+        "",
+    ],
+)
+def test_plain_prose_fast_path(md_text):
+    """fast path for plain text must match a full parser render"""
+    expected = _default_parser(True, False).render(md_text).strip()
+    assert md_to_html(md_text) == expected
+
+
+def test_md_to_html_cache():
+    md_text = "Cached **render**"
+    md_to_html.cache_clear()
+    assert md_to_html(md_text) is md_to_html(md_text)
+    md_to_html.cache_clear()
+    assert md_to_html(md_text) == "<p>Cached <strong>render</strong></p>"
+
+
+def test_md_to_html_cache_custom_extensions():
+    md_text = "Cached **render**"
+    paragraph = [PARAGRAPH]
+    with_emphasis = [PARAGRAPH, Plugin("emphasis")]
+    md_to_html.cache_clear()
+    # equal plugin lists share a cache entry, even as different objects
+    assert md_to_html(md_text, rust_extensions=paragraph) is md_to_html(
+        md_text, rust_extensions=[Plugin("paragraph")]
+    )
+    assert md_to_html(md_text, rust_extensions=paragraph) == (
+        "<p>Cached **render**</p>"
+    )
+    assert md_to_html(md_text, rust_extensions=with_emphasis) == (
+        "<p>Cached <strong>render</strong></p>"
+    )
+    # a generator is only consumed once, for both the cache key and the parser
+    assert (
+        md_to_html(
+            md_text, rust_extensions=(plugin for plugin in with_emphasis)
+        )
+        == "<p>Cached <strong>render</strong></p>"
+    )
+
+
+def test_plugin_set_cache_key():
+    def link(open_links_in_new_tab):
+        return LinkExtensionPlugin(
+            embed_third_party_content=False,
+            open_links_in_new_tab=open_links_in_new_tab,
+        )
+
+    class CustomPlugin(Plugin):
+        pass
+
+    assert _PluginSet.from_plugins([link(True)]) == _PluginSet.from_plugins(
+        [link(True)]
+    )
+    assert _PluginSet.from_plugins([link(True)]) != _PluginSet.from_plugins(
+        [link(False)]
+    )
+    # plugins with state outside their getters are rendered uncached
+    citations = CitationExtensionPlugin(
+        citations=[], open_links_in_new_tab=True
+    )
+    assert _PluginSet.from_plugins([PARAGRAPH, citations]) is None
+    assert _PluginSet.from_plugins([CustomPlugin("paragraph")]) is None
+
+
+def test_md_to_html_batch():
+    md_texts = [
+        "hi\nhi",
+        "**bold**",
+        "",
+        "Email me at a@b.com",
+        "Plain.",
+        "hi\nhi",
+    ]
+    assert md_to_html_batch(md_texts) == [md_to_html(text) for text in md_texts]
+
+
+def test_md_to_html_batch_custom_extensions():
+    md_texts = ["Batched **render**", "Plain."]
+    plugins = [PARAGRAPH, Plugin("emphasis")]
+    expected = [md_to_html(text, rust_extensions=plugins) for text in md_texts]
+    hits = _plugin_set_parser.cache_info().hits
+    # reuses the parser md_to_html built for an equal plugin list
+    assert md_to_html_batch(md_texts, rust_extensions=iter(plugins)) == expected
+    assert _plugin_set_parser.cache_info().hits == hits + 1
+
+
+def citation_html(citation: CitationQM, open_links_in_new_tab: bool) -> str:
+    target = ' target="_blank"' if open_links_in_new_tab else ""
+    return f'<a href="{citation.source}"{target}>{citation.index}</a>'
+
+
+def assert_citations_in_order(
+    html: str, citations: list[CitationQM], open_links_in_new_tab: bool
+) -> None:
+    # every citation is a <sup> followed by its link, and there are no other <sup>s
+    expected = [
+        part
+        for citation in citations
+        for part in ("<sup>", citation_html(citation, open_links_in_new_tab))
+    ]
+    # one scan over the html, matches come back in document order
+    pattern = re.compile("|".join(map(re.escape, dict.fromkeys(expected))))
+    assert [m.group() for m in pattern.finditer(html)] == expected
+
+
 class TestCitationProcessor:
     def test_citation(self):
         md_text = "Steve Jobs was a human being 【1】"
@@ -193,7 +336,7 @@ class TestCitationProcessor:
                     ],
                     open_links_in_new_tab=False,
                 ),
-                quickmark.Plugin(name="paragraph"),
+                PARAGRAPH,
             ],
         )
         assert (
@@ -218,7 +361,7 @@ class TestCitationProcessor:
                     ],
                     open_links_in_new_tab=True,
                 ),
-                quickmark.Plugin(name="paragraph"),
+                PARAGRAPH,
             ],
         )
 
@@ -227,61 +370,123 @@ class TestCitationProcessor:
             == '<p>Steve Jobs was a human being <sup><a href="http://www.example.com" target="_blank">1</a></sup></p>'
         )
 
+    def test_two_citations_in_order(self):
+        md_text = "Steve Jobs 【2】 was a human being 【1】"
+        # the citation preprocessor renumbers markers by order of appearance
+        # (【0】, 【1】, ...), so the list is in that order, not by index
+        citations = [
+            CitationQM(
+                index=index,
+                title="title",
+                source=f"http://www.example.com/{index}",
+                passage="passage",
+                md_offset=md_text.index(f"【{index}】"),
+            )
+            for index in (2, 1)
+        ]
+        html_text = md_to_html(
+            md_text,
+            rust_extensions=[
+                CitationExtensionPlugin(
+                    citations=citations, open_links_in_new_tab=True
+                ),
+                PARAGRAPH,
+            ],
+        )
+        assert_citations_in_order(
+            html_text, citations, open_links_in_new_tab=True
+        )
 
-class TestMathExtension:
-    def has_inline_latex(self, text: str) -> bool:
-        return '<math display="inline">' in text
-
-    def has_block_latex(self, text: str) -> bool:
-        return '<math display="block">' in text
+    def test_two_citations_with_same_source(self):
+        md_text = "Steve Jobs 【1】【2】 was a human being"
+        citations = [
+            CitationQM(
+                index=index,
+                title="title",
+                source="http://www.example.com",
+                passage=f"passage {index}",
+                md_offset=md_text.index(f"【{index}】"),
+            )
+            for index in (1, 2)
+        ]
+        html_text = md_to_html(
+            md_text,
+            rust_extensions=[
+                CitationExtensionPlugin(
+                    citations=citations, open_links_in_new_tab=False
+                ),
+                PARAGRAPH,
+            ],
+        )
+        assert_citations_in_order(
+            html_text, citations, open_links_in_new_tab=False
+        )
 
-    def has_latex(self, text: str) -> bool:
-        return self.has_inline_latex(text) or self.has_block_latex(text)
 
-    def test_no_latex(self):
-        text = "Text without dollar sign."
-        text = md_to_html(text)
-        assert not self.has_latex(text)
+INLINE_LATEX = '<math display="inline">'
+BLOCK_LATEX = '<math display="block">'
+
+NO_LATEX_CASES = [
+    pytest.param("Text without dollar sign.", id="no_latex"),
+    pytest.param("A \\$ sign, another \\$ sign.", id="dollar_sign"),
+    pytest.param(
+        "Dollar sign is often use in code ```$1 $2```.", id="code_block"
+    ),
+    pytest.param("invalid latex $a^2^2$", id="invalid_latex"),
+    pytest.param("**$5** is less than **$6**", id="bold_dollar_no_latex"),
+    # closing dollar followed by ascii symbol is not LaTeX
+    pytest.param("$5 is less than $6!", id="ascii_symbol_after_dollar"),
+]
+INLINE_LATEX_CASES = [
+    pytest.param("An inline latex $a^2$", id="inline_latex_dollar"),
+    pytest.param("$y' = mx + b$", id="inline_latex"),
+    pytest.param("P区：$E(x)$", id="inline_latex_full_colon"),
+]
+BLOCK_LATEX_CASES = [
+    pytest.param("A display latex $$a^2$$", id="display_latex_dollar"),
+    pytest.param("$$\na^2\n$$", id="display_latex_multiline"),
+    pytest.param("$$y' = mx + b$$", id="display_latex_dollar_2"),
+]
+LATEX_DOLLAR_SPACING_MD = textwrap.dedent(r"""
+    - If each donates **$10**, the total generated would be:
+    $ 60,060 \times 10 = \$600,600 $.
+   """).strip()
 
-    def test_dollar_sign(self):
-        text = "A \\$ sign, another \\$ sign."
-        text = md_to_html(text)
-        assert not self.has_latex(text)
 
-    def test_code_block(self):
-        text = "Dollar sign is often use in code ```$1 $2```."
-        text = md_to_html(text)
-        assert not self.has_latex(text)
+class TestMathExtension:
+    @pytest.fixture(scope="class")
+    def rendered(self) -> dict[str, str]:
+        """html of every parametrized case, rendered in a single batch"""
+        texts = [
+            case.values[0]
+            for case in (
+                *NO_LATEX_CASES,
+                *INLINE_LATEX_CASES,
+                *BLOCK_LATEX_CASES,
+            )
+        ]
+        return dict(zip(texts, md_to_html_batch(texts)))
 
-    def test_inline_latex_dollar(self):
-        text = "An inline latex $a^2$"
-        text = md_to_html(text)
-        assert self.has_inline_latex(text)
+    def has_inline_latex(self, text: str) -> bool:
+        return INLINE_LATEX in text
 
-    def test_display_latex_dollar(self):
-        text = "A display latex $$a^2$$"
-        text = md_to_html(text)
-        assert self.has_block_latex(text)
+    def has_block_latex(self, text: str) -> bool:
+        return BLOCK_LATEX in text
 
-    def test_display_latex_multiline(self):
-        text = "$$\na^2\n$$"
-        text = md_to_html(text)
-        assert self.has_block_latex(text)
+    def has_latex(self, text: str) -> bool:
+        return self.has_inline_latex(text) or self.has_block_latex(text)
 
-    def test_inline_latex(self):
-        text = "$y' = mx + b$"
-        text = md_to_html(text)
-        assert self.has_inline_latex(text)
+    @pytest.mark.parametrize("text", NO_LATEX_CASES)
+    def test_no_latex(self, text, rendered):
+        assert not self.has_latex(rendered[text])
 
-    def test_inline_latex_full_colon(self):
-        text = "P区：$E(x)$"
-        text = md_to_html(text)
-        assert self.has_inline_latex(text)
+    @pytest.mark.parametrize("text", INLINE_LATEX_CASES)
+    def test_inline_latex(self, text, rendered):
+        assert self.has_inline_latex(rendered[text])
 
-    def test_display_latex_dollar_2(self):
-        text = "$$y' = mx + b$$"
-        text = md_to_html(text)
-        assert self.has_block_latex(text)
+    @pytest.mark.parametrize("text", BLOCK_LATEX_CASES)
+    def test_block_latex(self, text, rendered):
+        assert self.has_block_latex(rendered[text])
 
     def test_display_latex(self):
         text = "$<x>\"y' = 2$"
@@ -289,11 +494,6 @@ class TestMathExtension:
         output_html = (md_to_html(text)).replace("\n", "")
         assert output_html == expected_html
 
-    def test_invalid_latex(self):
-        text = "invalid latex $a^2^2$"
-        text = md_to_html(text)
-        assert not self.has_latex(text)
-
     def test_mix_invalid_latex(self):
         text = "Mix of valid latex $a^2$ and invalid latext $a^2^2$"
         text = md_to_html(text)
@@ -305,11 +505,6 @@ class TestMathExtension:
         assert self.has_inline_latex(text)
         assert "<strong>" in text
 
-    def test_bold_dollar_no_latex(self):
-        text = "**$5** is less than **$6**"
-        text = md_to_html(text)
-        assert not self.has_latex(text)
-
     def test_between_dollar(self):
         # without invalidating if there's an unescaped dollar
         # the very first dollar is a valid opening dollar
@@ -347,12 +542,6 @@ class TestMathExtension:
             in text
         )
 
-    def test_ascii_symbol_after_dollar(self):
-        """Should not convert to LaTeX if closing dollar followed by ascii symbol"""
-        text = "$5 is less than $6!"
-        text = md_to_html(text)
-        assert not self.has_latex(text)
-
     def test_triple_apostrophe(self):
         """DoubleSuperscriptsError from mathml extension unless we workaround: https://github.com/roniemartinez/latex2mathml/issues/462"""
         text = "$f(x) = \\sum_{n=0}^{\\infty} \\frac{f^{(n)}(0)}{n!} x^n = f(0) + f'(0)x + \\frac{f''(0)}{2!}x^2 + \\frac{f'''(0)}{3!}x^3 + \\dots$"
@@ -400,12 +589,7 @@ class TestMathExtension:
 
     def test_latex_dollar_spacing(self):
         """Test case relating to spacing around dollar signs"""
-        text = textwrap.dedent(r"""
-            - If each donates **$10**, the total generated would be:
-            $ 60,060 \times 10 = \$600,600 $.
-           """).strip()
-
-        text = md_to_html(text)
+        text = md_to_html(LATEX_DOLLAR_SPACING_MD)
         assert (
             text
             == '<ul>\n<li>If each donates <strong>$10</strong>, the total generated would be:<br />\n<math display="inline"><mn>60,060</mn><mo>×</mo><mn>10</mn><mo>=</mo><mi>$</mi><mn>600,600</mn></math>.</li>\n</ul>'
@@ -414,18 +598,20 @@ class TestMathExtension:
         assert self.has_latex(text)
 
 
+PYTHON_FENCE_MD = textwrap.dedent(r"""
+    ```python
+    y = 2
+    x = 3
+    ```
+   """).strip()
+
+
 class TestCodeExtension:
     def test_file_header(self):
         """check for file header (labels language in FE when rendered)"""
-        text = textwrap.dedent(r"""
-            ```python
-            y = 2
-            x = 3
-            ```
-           """).strip()
-
         text = md_to_html(
-            text, rust_extensions=[InkjetPlugin(pygments_classes=True)]
+            PYTHON_FENCE_MD,
+            rust_extensions=[InkjetPlugin(pygments_classes=True)],
         )
         assert text.startswith(
             '<div class="codehilite"><span class="filename">Python</span><pre><span></span><code>'
@@ -0,0 +1,82 @@
+import pytest
+
+from quickmark import CitationQM
+from quickmark.postprocess import (
+    NodeChunk,
+    extract_citations,
+    find_and_reorder_consecutive_citations,
+    fix_list_spacing_indentation,
+    guard_tag,
+    remove_think_details_tags,
+)
+
+
+def test_extract_citations_drops_invalid_index():
+    passages = [NodeChunk(source="https://a.com", title="A", text="a")]
+    text, citations, truncated = extract_citations("Claim【1】【3】.", passages)
+    assert text == "Claim【1】."
+    assert [citation.to_md() for citation in citations] == ["【1】"]
+    assert not truncated
+
+
+def test_extract_citations_does_not_mutate_passages():
+    passages = [
+        NodeChunk(source="https://a.com", title="A", text="a"),
+        NodeChunk(source="https://b.com", title="B", text="b"),
+    ]
+    first = extract_citations("B【2】 then A【1】.", passages)
+    second = extract_citations("B【2】 then A【1】.", passages)
+    assert first[0] == second[0] == "B【1】 then A【2】."
+    assert [citation.source for citation in first[1]] == [
+        citation.source for citation in second[1]
+    ]
+    assert [passage.source for passage in passages] == [
+        "https://a.com",
+        "https://b.com",
+    ]
+
+
+def test_find_and_reorder_consecutive_citations():
+    citations = [CitationQM(index, "", "", "", 0) for index in (3, 1, 2)]
+    text, citations = find_and_reorder_consecutive_citations(
+        "A【3】【1】. B【2】.", citations
+    )
+    assert text == "A【1】【3】. B【2】."
+    assert [(c.index, c.md_offset) for c in citations] == [
+        (1, 1),
+        (3, 4),
+        (2, 0),
+    ]
+
+
+def test_fix_list_spacing_indentation_crlf():
+    # CRLF lines are split like LF ones, and keep their endings
+    assert (
+        fix_list_spacing_indentation("Intro:\r\n   - a\r\n   - b\r\nOutro")
+        == "Intro:\n\n- a\r\n- b\r\nOutro"
+    )
+
+
+class TestThinkTags:
+    @pytest.mark.parametrize(
+        ("response", "expected"),
+        [
+            pytest.param(
+                "<think>\nhmm\n</think>\n\nAnswer", "Answer", id="closed"
+            ),
+            pytest.param("<think>\nhmm\n</think>", ".", id="only_reasoning"),
+            pytest.param("<think>\nStill thinking...", ".", id="unclosed"),
+            pytest.param(
+                "<think>\n\n</think>Hello", "Hello", id="empty_reasoning"
+            ),
+            pytest.param(
+                "Answer <think>\nhmm\n</think>",
+                "Answer <think>\nhmm\n</think>",
+                id="embedded",
+            ),
+            pytest.param("No tags here", "No tags here", id="no_tags"),
+        ],
+    )
+    def test_guard_tag_and_remove_think(self, response, expected):
+        with_details = guard_tag("think", response)
+        assert remove_think_details_tags(with_details) == expected